@@ -3,34 +3,94 @@ import re
 import sys
 from pathlib import Path
 
+try:
+    import pygit2
+except ImportError:  # fall back to the git CLI
+    pygit2 = None
+
 # Set path to zmk-config relative to the script location
 SCRIPT_DIR = Path(__file__).resolve().parent
 REPO_DIR = SCRIPT_DIR / "zmk-config"
 
+# Semantic versioning tags like v1.2.3 or 1.2.3 (patch optional)
+VERSION_RE = re.compile(r'^v?(\d+)\.(\d+)(?:\.(\d+))?$')
+
+# git writes its own progress and errors straight to the terminal
 def run_git_command(cmd, cwd):
-    result = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"❌ Error running {' '.join(cmd)}:\n{result.stderr.strip()}")
+    if subprocess.run(cmd, cwd=cwd).returncode != 0:
+        print(f"❌ Error running {' '.join(cmd)}")
+        sys.exit(1)
+
+# Only commands whose output we parse pay for a pipe and a decode
+def run_git_capture(cmd, cwd):
+    try:
+        return subprocess.check_output(cmd, cwd=cwd).decode().splitlines()
+    except subprocess.CalledProcessError:
+        print(f"❌ Error running {' '.join(cmd)}")
         sys.exit(1)
-    return result.stdout.strip()
+
+if pygit2 is not None:
+    # Authenticate through ssh-agent and turn rejected pushes into errors
+    class GitCallbacks(pygit2.RemoteCallbacks):
+        def __init__(self):
+            super().__init__()
+            self.offered_agent_key = False
+
+        def credentials(self, url, username_from_url, allowed_types):
+            # libgit2 asks again for as long as auth fails, so only offer the agent once;
+            # the GitError (like Passthrough for HTTPS) falls back to the git CLI
+            if self.offered_agent_key:
+                raise pygit2.GitError(f"ssh-agent authentication to {url} failed")
+            if allowed_types & pygit2.enums.CredentialType.SSH_KEY:
+                self.offered_agent_key = True
+                return pygit2.KeypairFromAgent(username_from_url or "git")
+            raise pygit2.Passthrough
+
+        def push_update_reference(self, refname, message):
+            if message:
+                raise pygit2.GitError(f"{refname}: {message}")
+
+# Open repo_dir with libgit2, or return None to use the git CLI instead
+def open_repo(repo_dir):
+    if pygit2 is None:
+        return None
+    try:
+        return pygit2.Repository(str(repo_dir))
+    except pygit2.GitError:
+        return None
+
+# Only the remote's tag names are needed, so list refs without downloading any objects
+def list_remote_tags(repo_dir):
+    repo = open_repo(repo_dir)
+    if repo is not None:
+        try:
+            heads = repo.remotes["origin"].list_heads(callbacks=GitCallbacks())
+            return [head.name[len("refs/tags/"):] for head in heads
+                    if head.name.startswith("refs/tags/") and not head.name.endswith("^{}")]
+        except (pygit2.GitError, KeyError):
+            pass  # e.g. HTTPS credentials libgit2 can't see; let git handle it
+
+    refs = run_git_capture(["git", "ls-remote", "--tags", "--refs", "origin"], cwd=repo_dir)
+    return [line.split("\trefs/tags/", 1)[1] for line in refs]
+
+def version_key(tag):
+    match = VERSION_RE.match(tag)
+    if not match:
+        return None
+    return (int(match[1]), int(match[2]), int(match[3] or 0))
 
 def get_latest_tag(repo_dir):
-    run_git_command(["git", "fetch", "--tags"], cwd=repo_dir)
-    tags = run_git_command(["git", "tag"], cwd=repo_dir).splitlines()
+    tags = list_remote_tags(repo_dir)
     
-    # Filter only tags that match semantic versioning like v1.2.3 or 1.2.3
-    version_tags = [t for t in tags if re.match(r'^v?\d+\.\d+(\.\d+)?$', t)]
+    # Keep the highest semantic version in a single pass, skipping other tags
+    versions = ((key, tag) for tag in tags if (key := version_key(tag)))
+    latest = max(versions, default=None)
     
-    if not version_tags:
+    if latest is None:
         print("❌ No valid semantic version tags found.")
         sys.exit(1)
     
-    # Sort tags by version
-    def version_key(tag):
-        return list(map(int, re.sub('^v', '', tag).split('.')))
-
-    latest = sorted(version_tags, key=version_key)[-1]
-    return latest
+    return latest[1]
 
 
 def bump_minor(tag):
@@ -42,8 +102,31 @@ def bump_minor(tag):
     return f"v{major}.{minor + 1}.0"
 
 def create_and_push_tag(tag, repo_dir):
-    run_git_command(["git", "tag", tag], cwd=repo_dir)
-    run_git_command(["git", "push", "origin", tag], cwd=repo_dir)
+    repo = open_repo(repo_dir)
+    if repo is None:
+        run_git_command(["git", "tag", tag], cwd=repo_dir)
+    else:
+        try:
+            repo.references.create(f"refs/tags/{tag}", repo.head.target)
+        except (pygit2.GitError, ValueError) as e:
+            print(f"❌ Error creating tag {tag}:\n{e}")
+            sys.exit(1)
+
+    pushed = False
+    try:
+        if repo is not None:
+            try:
+                repo.remotes["origin"].push([f"refs/tags/{tag}"], callbacks=GitCallbacks())
+                pushed = True
+            except (pygit2.GitError, KeyError):
+                pass  # let git push with its own credential helpers
+        if not pushed:
+            run_git_command(["git", "push", "origin", tag], cwd=repo_dir)
+            pushed = True
+    finally:
+        # Don't leave an unpushed tag behind, or the next run can't create it again
+        if not pushed:
+            subprocess.run(["git", "tag", "-d", tag], cwd=repo_dir, stdout=subprocess.DEVNULL)
     print(f"✅ Created and pushed tag: {tag}")
 
 def main():
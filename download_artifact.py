@@ -1,9 +1,37 @@
 import requests
 import zipfile
+import json
 import os
 import shutil
 import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from functools import partial
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CACHE_FILE = Path('.gh_cache.json')
+MAX_RATE_LIMIT_WAIT = 90  # seconds
+
+# Newest tags first, each with the commit it points at (peeling annotated tags)
+TAGS_QUERY = """
+query($owner: String!, $name: String!) {
+  repository(owner: $owner, name: $name) {
+    refs(refPrefix: "refs/tags/", first: 100, orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) {
+      nodes {
+        name
+        target {
+          oid
+          ... on Tag { target { oid } }
+        }
+      }
+    }
+  }
+}
+"""
 
 def load_env_file():
     """Load variables from .env file"""
@@ -24,6 +52,140 @@ def load_env_file():
         return None
     return env_vars
 
+def load_cache():
+    """Load cached API responses and extracted artifacts from disk"""
+    try:
+        with open(CACHE_FILE, 'r') as f:
+            stored = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        stored = {}
+    # Responses are only carried forward when requested again, so old run URLs drop out
+    return {
+        "previous": stored.get("responses", {}),
+        "responses": {},
+        "artifacts": stored.get("artifacts", {}),
+    }
+
+def save_cache(cache):
+    """Persist this run's responses and the artifacts that are still extracted"""
+    artifacts = {artifact_id: path for artifact_id, path in cache["artifacts"].items() if Path(path).exists()}
+    with open(CACHE_FILE, 'w') as f:
+        json.dump({"responses": cache["responses"], "artifacts": artifacts}, f)
+
+def create_session(token):
+    """Create a session that reuses one connection and backs off on transient errors"""
+    session = requests.Session()
+    session.headers.update({
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github.v3+json"
+    })
+    # Rate limits (403/429) are left to wait_for_rate_limit so MAX_RATE_LIMIT_WAIT applies
+    retry = Retry(
+        total=3,
+        backoff_factor=1.0,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["GET", "POST"],  # the only POST is the read-only GraphQL query
+        respect_retry_after_header=True,
+    )
+    session.mount("https://", HTTPAdapter(max_retries=retry))
+    session.hooks["response"].append(partial(wait_for_rate_limit, session))
+    return session
+
+def rate_limit_delay(response):
+    """Seconds until a rate-limited request may be retried, or None if it isn't rate limited"""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            # Retry-After may also be an HTTP-date
+            return parsedate_to_datetime(retry_after).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        return int(response.headers.get("X-RateLimit-Reset", 0)) - time.time()
+    return None
+
+def wait_for_rate_limit(session, response, *args, **kwargs):
+    """Response hook: wait out a short rate limit and resend the request once"""
+    if response.status_code not in (403, 429):
+        return None
+    delay = rate_limit_delay(response)
+    if delay is None or delay > MAX_RATE_LIMIT_WAIT:
+        return None
+    
+    print(f"Rate limited, waiting {max(delay, 0):.0f}s...")
+    response.close()
+    time.sleep(max(delay, 0) + 1)
+    
+    # Resend through the session for redirect handling, without this hook so it only retries once
+    request = response.request.copy()
+    request.hooks = {"response": []}
+    return session.send(request, **kwargs)
+
+def get_json(session, url, cache):
+    """GET a GitHub API endpoint, revalidating any cached body with its ETag"""
+    entry = cache["previous"].get(url)
+    headers = {}
+    if entry:
+        # 304 Not Modified responses don't count against the rate limit
+        headers["If-None-Match"] = entry["etag"]
+    
+    response = session.get(url, headers=headers)
+    if response.status_code == 304:
+        cache["responses"][url] = entry
+        return entry["body"]
+    response.raise_for_status()
+    
+    body = response.json()
+    if "ETag" in response.headers:
+        cache["responses"][url] = {"etag": response.headers["ETag"], "body": body}
+    return body
+
+def get_tags(session, owner, repo):
+    """Fetch (tag name, commit sha) pairs, newest first, in one GraphQL call"""
+    response = session.post(
+        "https://api.github.com/graphql",
+        json={"query": TAGS_QUERY, "variables": {"owner": owner, "name": repo}},
+    )
+    response.raise_for_status()
+    
+    result = response.json()
+    if result.get("errors"):
+        raise RuntimeError(f"GraphQL error: {result['errors'][0]['message']}")
+    
+    tags = []
+    for node in result["data"]["repository"]["refs"]["nodes"]:
+        target = node["target"]
+        tags.append((node["name"], target.get("target", target)["oid"]))
+    return tags
+
+def extract_archive(zip_ref, dest):
+    """Extract all members of zip_ref into dest, decompressing on a thread pool"""
+    # zipfile creates parent directories without guarding against races, so
+    # extract directories and the first member of each directory up front
+    seen_dirs, pending = set(), []
+    for member in zip_ref.infolist():
+        parent = os.path.dirname(member.filename)
+        if member.is_dir() or parent not in seen_dirs:
+            seen_dirs.add(parent)
+            zip_ref.extract(member, dest)
+        else:
+            pending.append(member)
+    
+    # Reads of the shared archive are serialized by zipfile; zlib releases the GIL
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(lambda member: zip_ref.extract(member, dest), pending))
+
+def open_in_explorer(path):
+    """Open a new Explorer window at path (Windows only)"""
+    if os.name == 'nt':
+        subprocess.Popen(['explorer', str(path.resolve())])
+    else:
+        print("Opening file explorer is only supported on Windows in this script.")
+
 def download_latest_artifact():
     # Load configuration from .env file
     env_vars = load_env_file()
@@ -39,108 +201,99 @@ def download_latest_artifact():
         print("Required: GITHUB_TOKEN, GITHUB_OWNER, GITHUB_REPO")
         return
     
-    # Headers for authentication
-    headers = {
-        "Authorization": f"token {TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
-    }
+    # One session for every request so the TLS connection is reused
+    session = create_session(TOKEN)
     
+    cache = load_cache()
     try:
-        # Get latest workflow run
-        print("Getting latest workflow run...")
-        runs_url = f"https://api.github.com/repos/{OWNER}/{REPO}/actions/runs"
-        runs_response = requests.get(runs_url, headers=headers)
-        runs_response.raise_for_status()
-        
-        runs = runs_response.json()["workflow_runs"]
-        if not runs:
-            print("No workflow runs found")
-            return
+        # The tag lookup doesn't depend on the workflow run, so run it alongside the REST calls;
+        # leaving the with-block joins the worker before the session is closed
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            tags_future = executor.submit(get_tags, session, OWNER, REPO)
+            
+            # Get latest workflow run
+            print("Getting latest workflow run...")
+            # Only the newest run and its first artifact are used, so don't page through the rest
+            runs_url = f"https://api.github.com/repos/{OWNER}/{REPO}/actions/runs?per_page=1"
+            runs = get_json(session, runs_url, cache)["workflow_runs"]
+            if not runs:
+                print("No workflow runs found")
+                return
+                
+            latest_run = runs[0]
+            run_id = latest_run["id"]
+            commit_sha = latest_run["head_sha"]
+            print(f"Found run: {run_id} at commit {commit_sha}")
+            
+            # Get artifacts for this run
+            artifacts_url = f"https://api.github.com/repos/{OWNER}/{REPO}/actions/runs/{run_id}/artifacts?per_page=1"
+            artifacts = get_json(session, artifacts_url, cache)["artifacts"]
+            if not artifacts:
+                print("No artifacts found in latest run")
+                return
+            
+            # Get the latest tag for the commit
+            # Note: GitHub API does not have a direct endpoint to get tags for a commit,
+            # so we'll get the newest tags and find the latest one pointing to the commit.
+            tags = tags_future.result()
             
-        latest_run = runs[0]
-        run_id = latest_run["id"]
-        commit_sha = latest_run["head_sha"]
-        print(f"Found run: {run_id} at commit {commit_sha}")
-        
-        # Get the latest tag for the commit
-        tags_url = f"https://api.github.com/repos/{OWNER}/{REPO}/commits/{commit_sha}/tags"
-        # Note: GitHub API does not have a direct endpoint to get tags for a commit,
-        # so we'll get all tags and find the latest one pointing to the commit.
-        # Instead, list tags and check which one points to this commit.
-        
-        tags_list_url = f"https://api.github.com/repos/{OWNER}/{REPO}/tags"
-        tags_response = requests.get(tags_list_url, headers=headers)
-        tags_response.raise_for_status()
-        tags = tags_response.json()
-        
-        latest_tag = None
-        for tag in tags:
-            if tag["commit"]["sha"] == commit_sha:
-                latest_tag = tag["name"]
-                break
-        
-        if not latest_tag:
             # If no tag found pointing exactly to the commit, fallback to latest tag overall
-            latest_tag = tags[0]["name"] if tags else "untagged"
-        
-        print(f"Using tag: {latest_tag}")
-        
-        # Get artifacts for this run
-        artifacts_url = f"https://api.github.com/repos/{OWNER}/{REPO}/actions/runs/{run_id}/artifacts"
-        artifacts_response = requests.get(artifacts_url, headers=headers)
-        artifacts_response.raise_for_status()
-        
-        artifacts = artifacts_response.json()["artifacts"]
-        if not artifacts:
-            print("No artifacts found in latest run")
-            return
+            fallback_tag = tags[0][0] if tags else "untagged"
+            latest_tag = next((name for name, sha in tags if sha == commit_sha), fallback_tag)
             
-        # Take the first artifact (or modify to choose specific one)
-        artifact = artifacts[0]
-        artifact_name = artifact["name"]
-        download_url = artifact["archive_download_url"]
-        
-        print(f"Downloading artifact: {artifact_name}")
-        
-        # Download the artifact
-        download_response = requests.get(download_url, headers=headers)
-        download_response.raise_for_status()
-        
-        # Save to temp zip file
-        zip_path = f"{artifact_name}.zip"
-        with open(zip_path, "wb") as f:
-            f.write(download_response.content)
-        
-        # Create timestamped directory under releases with tag prefix
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        releases_dir = Path("releases")
-        releases_dir.mkdir(exist_ok=True)
-        
-        release_dir = releases_dir / f"{latest_tag}-{timestamp}"
-        release_dir.mkdir()
-        
-        # Extract the zip
-        print(f"Extracting to {release_dir}...")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(release_dir)
-        
-        # Clean up temp zip
-        os.remove(zip_path)
-        
-        print(f"Success! Artifact extracted to ./{release_dir}/")
-        print(f"Contents: {list(release_dir.iterdir())}")
-        
-        # Open new Explorer window (Windows only)
-        if os.name == 'nt':
-            subprocess.Popen(['explorer', str(release_dir.resolve())])
-        else:
-            print("Opening file explorer is only supported on Windows in this script.")
+            print(f"Using tag: {latest_tag}")
+            
+            # Take the first artifact (or modify to choose specific one)
+            artifact = artifacts[0]
+            artifact_name = artifact["name"]
+            download_url = artifact["archive_download_url"]
+            
+            # Skip the download entirely if this artifact was already extracted
+            extracted = cache["artifacts"]
+            previous_dir = extracted.get(str(artifact["id"]))
+            if previous_dir and Path(previous_dir).exists():
+                print(f"Artifact {artifact_name} already extracted to ./{previous_dir}/")
+                open_in_explorer(Path(previous_dir))
+                return
+            
+            print(f"Downloading artifact: {artifact_name}")
+            
+            # Stream the artifact into an anonymous temp file that ZipFile can read directly
+            # (SpooledTemporaryFile lacks the seekable() ZipFile needs before Python 3.11)
+            with tempfile.TemporaryFile() as archive:
+                with session.get(download_url, stream=True) as download_response:
+                    download_response.raise_for_status()
+                    download_response.raw.decode_content = True
+                    shutil.copyfileobj(download_response.raw, archive, length=1 << 20)
+                
+                # Create timestamped directory under releases with tag prefix
+                from datetime import datetime
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                releases_dir = Path("releases")
+                releases_dir.mkdir(exist_ok=True)
+                
+                release_dir = releases_dir / f"{latest_tag}-{timestamp}"
+                release_dir.mkdir()
+                
+                # Extract the zip
+                print(f"Extracting to {release_dir}...")
+                with zipfile.ZipFile(archive, 'r') as zip_ref:
+                    extract_archive(zip_ref, release_dir)
+            
+            extracted[str(artifact["id"])] = str(release_dir)
+            
+            print(f"Success! Artifact extracted to ./{release_dir}/")
+            print(f"Contents: {list(release_dir.iterdir())}")
+            
+            open_in_explorer(release_dir)
         
     except requests.exceptions.RequestException as e:
         print(f"API Error: {e}")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        session.close()
+        save_cache(cache)
 
 if __name__ == "__main__":
     download_latest_artifact()
@@ -1,108 +1,127 @@
 #!/usr/bin/env python3
 """ZMK Keymap Formatter - Aligns bindings blocks with consistent column widths."""
 
+import os
 import re
+import shutil
 import sys
+from bisect import bisect_right
+from itertools import zip_longest
 from pathlib import Path
 
-def is_keymap_bindings(lines, i):
-    """Check if bindings block is in keymap layer."""
-    bc, in_keymap = 0, False
-    for j in range(i, -1, -1):
-        line = lines[j].strip()
-        bc += line.count('}') - line.count('{')
-        if bc > 0: break
-        if re.search(r'^\s*\w+\s*\{', line):
-            kbc = 0
-            for k in range(j, -1, -1):
-                kline = lines[k].strip()
-                kbc += kline.count('}') - kline.count('{')
-                if kbc > 0: break
-                if 'keymap' in kline and '{' in kline:
-                    in_keymap = True
-                    break
-            break
-    return in_keymap
+_COMMENT_RE = re.compile(rb'//[^\n]*')
+_ANGLE_RE = re.compile(rb'[<>]')
+_KEY_RE = re.compile(rb'&\s*([^&>]*)')
+_SCAN_RE = re.compile(rb'//[^\n]*|/\*.*?\*/|[{}]|(?<![\w-])bindings\s*=', re.DOTALL)
+_NODE_RE = re.compile(rb'([\w-]+)\s*$')
+
+# (row, col) of each binding in the 4-row grid: 6+2+6, 6+2+6, 6+2+6, 2+6+6
+_GRID_COLS = 14
+_GRID_POSITIONS = [(k // 12, k % 12 + (2 if k % 12 >= 6 else 0)) for k in range(36)] + \
+                  [(3, k - 34) for k in range(36, 48)]
+
+def line_offsets(data):
+    """Start offset of each line in data, ending with len(data)."""
+    offsets = [0, *(m.end() for m in re.finditer(b'\n', data))]
+    if offsets[-1] != len(data): offsets.append(len(data))
+    return offsets
 
-def parse_bindings(lines, start):
-    """Extract keycodes from bindings block."""
-    i = start
-    while i < len(lines) and not lines[i].strip().endswith('<'): i += 1
-    i += 1
+def parse_bindings(data, offsets, start):
+    """Extract keycodes from bindings block straight into a grid."""
+    i, n = start, len(offsets) - 1
+    while i < n and not data[offsets[i]:offsets[i + 1]].strip().endswith(b'<'): i += 1
+    body_start = offsets[min(i + 1, n)]
     
-    content, bc = "", 1
-    while i < len(lines) and bc > 0:
-        line = lines[i].strip()
-        bc += line.count('<') - line.count('>')
-        line = re.sub(r'//.*$', '', line).strip()
-        if line and not line.startswith('>;'): content += " " + line
-        i += 1
+    # The block runs until the opening '<' is balanced by a '>'
+    bc, body_end, next_i = 1, len(data), n
+    for m in _ANGLE_RE.finditer(data, body_start):
+        bc += 1 if m[0] == b'<' else -1
+        if bc == 0:
+            body_end = m.start()
+            next_i = bisect_right(offsets, body_end)
+            break
     
-    keycodes = ['&' + p.strip() for p in content.strip().rstrip('>;').split('&') if p.strip()]
-    return keycodes + [''] * (42 - len(keycodes)), i
-
-def make_grid(keycodes):
-    """Arrange into 4-row grid: 6+2+6, 6+2+6, 6+2+6, 2+6+6+2."""
-    return [keycodes[i:i+6] + ['', ''] + keycodes[i+6:i+12] for i in range(0, 36, 12)] + \
-           [['', ''] + keycodes[36:42] + keycodes[42:48] + ['', '']]
+    # Only the bindings themselves are decoded; the rest of the file stays bytes
+    body = _COMMENT_RE.sub(b'', data[body_start:body_end])
+    keys = (m[1] for m in _KEY_RE.finditer(body) if m[1].strip())
+    grid = [[''] * _GRID_COLS for _ in range(4)]
+    for (row, col), key in zip(_GRID_POSITIONS, keys):
+        grid[row][col] = '&' + b' '.join(key.split()).decode('utf-8')
+    return grid, next_i
 
 def calc_widths(grids):
     """Calculate max column widths."""
-    return [max(len(row[c]) for g in grids for row in g if c < len(row) and row[c]) + 1 
-            for c in range(len(grids[0][0]) if grids else 0)]
+    rows = (row for g in grids for row in g)
+    return [max(map(len, col)) + 1 for col in zip_longest(*rows, fillvalue='')]
+
+def row_format(widths):
+    """Build the %-format template for a grid row, tab before column 8."""
+    return ''.join(('\t' if c == 8 else '') + f'%-{w}s' for c, w in enumerate(widths))
 
-def format_grid(grid, widths):
+def format_grid(grid, fmt):
     """Convert grid to formatted lines."""
-    return [''.join(cell.ljust(widths[c]) if c != 8 else '\t' + cell.ljust(widths[c]) 
-                   for c, cell in enumerate(row)).rstrip() for row in grid]
+    return [(fmt % tuple(row)).rstrip() for row in grid]
 
 def format_zmk_file(file_path):
     """Format ZMK keymap file."""
     try:
-        with open(file_path, 'r') as f: lines = f.readlines()
+        data = Path(file_path).read_bytes()
     except Exception as e:
         print(f"Error reading file: {e}")
         return False
+    offsets = line_offsets(data)
     
-    # Find keymap bindings blocks
-    blocks, grids = [], []
-    i = 0
-    while i < len(lines):
-        if 'bindings =' in lines[i] and is_keymap_bindings(lines, i):
-            keycodes, next_i = parse_bindings(lines, i)
-            grid = make_grid(keycodes)
-            blocks.append((i, next_i, lines[i].rstrip(), grid))
+    # Find keymap bindings blocks in one pass, tracking enclosing node names
+    blocks, grids, nodes = [], [], []
+    m = _SCAN_RE.search(data)
+    while m:
+        pos = m.end()
+        if m[0][:1] == b'/':
+            pass  # braces in comments (e.g. layer diagrams) don't open or close nodes
+        elif m[0] == b'{':
+            name = _NODE_RE.search(data, data.rfind(b'\n', 0, m.start()) + 1, m.start())
+            nodes.append(name[1] if name else b'')
+        elif m[0] == b'}':
+            if nodes: nodes.pop()
+        elif b'keymap' in nodes:
+            i = bisect_right(offsets, m.start()) - 1
+            grid, next_i = parse_bindings(data, offsets, i)
+            blocks.append((i, next_i, grid))
             grids.append(grid)
-            i = next_i
-        else:
-            i += 1
+            pos = offsets[next_i]
+        m = _SCAN_RE.search(data, pos)
     
     if not blocks:
         print("No keymap bindings found")
         return True
     
     # Calculate global widths and format
-    widths = calc_widths(grids)
-    output, i, bi = [], 0, 0
+    fmt = row_format(calc_widths(grids))
+    output, last = bytearray(), 0
     
-    while i < len(lines):
-        if bi < len(blocks) and i == blocks[bi][0]:
-            start_i, next_i, bindings_line, grid = blocks[bi]
-            output.append(bindings_line)
-            output.extend(format_grid(grid, widths))
-            output.append('            >;')
-            bi += 1
-            i = next_i
-        else:
-            output.append(lines[i].rstrip())
-            i += 1
+    # Lines outside bindings blocks are copied through byte-for-byte
+    for start_i, next_i, grid in blocks:
+        bindings_line = data[offsets[start_i]:offsets[start_i + 1]]
+        eol = b'\r\n' if bindings_line.endswith(b'\r\n') else b'\n'
+        output += data[last:offsets[start_i]]
+        output += bindings_line.rstrip() + eol
+        for line in format_grid(grid, fmt):
+            output += line.encode('utf-8') + eol
+        output += b'            >;' + eol
+        last = offsets[next_i]
+    output += data[last:]
     
+    # Write to a sibling temp file and rename, so a failed write can't truncate the keymap
+    tmp_path = f"{file_path}.tmp"
     try:
-        with open(file_path, 'w') as f: f.write('\n'.join(output) + '\n')
+        with open(tmp_path, 'wb') as f: f.write(output)
+        shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
         print(f"Formatted {len(blocks)} bindings blocks in {file_path}")
         return True
     except Exception as e:
         print(f"Error writing file: {e}")
+        if os.path.exists(tmp_path): os.remove(tmp_path)
         return False
 
 def main():